@@ -42,11 +42,28 @@ import time
 import socket
 import subprocess
 import pathlib
-import re
 import secrets
-from typing import List, Tuple, Optional, Dict, Any
+import tempfile
+import gzip
+import queue
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Iterator, List, Tuple, Optional, Dict, Set, Any
 
-from flask import Flask, request, jsonify, send_from_directory, make_response
+try:
+    import orjson  # noqa: WPS433
+except Exception:
+    # Optional fast JSON; stdlib json is used when it is not installed.
+    orjson = None
+
+try:
+    import brotli  # noqa: WPS433
+except Exception:
+    # Optional; static responses are still gzip-compressed without it.
+    brotli = None
+
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_socketio import SocketIO, emit, join_room, leave_room
 
 # ---------------------------------------------------------------------------
@@ -56,14 +73,61 @@ BASE_DIR = pathlib.Path(__file__).resolve().parent
 INDEX_PATH = BASE_DIR / "index.html"
 EXPORT_PATH = BASE_DIR / "ultra_pomodoro_cloud.json"
 
+# Neither changes for the life of the process, so detect once at import.
+IS_MACOS = platform.system().lower() == "darwin"
+# On macOS/Linux geteuid exists; if not, assume no root.
+IS_ROOT = getattr(os, "geteuid", lambda: -1)() == 0
+# Process umask (read by setting it, so restore immediately) for files we
+# create via mkstemp, which always uses 0600.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
 HOSTS_FILE = "/etc/hosts"
 HOSTS_TAG_START = "# === ULTRA_POMODORO_BLOCK_START ==="
 HOSTS_TAG_END = "# === ULTRA_POMODORO_BLOCK_END ==="
+_HOSTS_TAG_END_LEN = len(HOSTS_TAG_END)
+
+# /api/block/test resolves domains concurrently and memoizes answers per window.
+RESOLVE_WORKERS = 16
+RESOLVE_CACHE_TTL = 60  # seconds
+
+# Let a front-end proxy stream index.html with sendfile(2):
+#   USE_X_SENDFILE=apache -> X-Sendfile header (Apache mod_xsendfile / lighttpd)
+#   USE_X_SENDFILE=nginx  -> X-Accel-Redirect to X_ACCEL_PREFIX + "index.html"
+USE_X_SENDFILE = os.environ.get("USE_X_SENDFILE", "").strip().lower()
+X_ACCEL_PREFIX = os.environ.get("X_ACCEL_PREFIX", "/_protected/")
 
 # ---------------------------------------------------------------------------
 # App init
 # ---------------------------------------------------------------------------
 app = Flask(__name__, static_folder=None)
+# Flask then emits X-Sendfile from send_from_directory instead of a body.
+app.config["USE_X_SENDFILE"] = USE_X_SENDFILE in ("1", "true", "apache")
+
+class OrjsonModule:
+    """json-module shim so python-socketio/engineio frame with orjson.
+
+    Falls back to stdlib json when orjson raises: encoding ints beyond 64 bits
+    or decoding NaN/Infinity. Like json_loads, decoding still turns ints beyond
+    64 bits into floats.
+    """
+
+    @staticmethod
+    def dumps(obj: Any, *args: Any, **kwargs: Any) -> str:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            return json.dumps(obj, *args, **kwargs)
+
+    @staticmethod
+    def loads(s: Any, *args: Any, **kwargs: Any) -> Any:
+        try:
+            return orjson.loads(s)
+        except ValueError:
+            return json.loads(s, *args, **kwargs)
+
+# python-socketio forwards `json` to its engineio server as well.
+SOCKETIO_JSON: Dict[str, Any] = {"json": OrjsonModule} if orjson is not None else {}
 # Generous ping settings to survive background-tab throttling and hosted network jitter.
 socketio = SocketIO(
     app,
@@ -71,72 +135,162 @@ socketio = SocketIO(
     async_mode=ASYNC_MODE,
     ping_interval=25,
     ping_timeout=60,
+    **SOCKETIO_JSON,
 )
+_RESOLVER_POOL = ThreadPoolExecutor(max_workers=RESOLVE_WORKERS,
+                                    thread_name_prefix="resolve")
 
 # ---------------------------------------------------------------------------
 # Utilities
 # ---------------------------------------------------------------------------
-def is_macos() -> bool:
-    return platform.system().lower() == "darwin"
+# orjson differs from stdlib json in two ways that matter here: it reads
+# integers wider than 64 bits as floats (silently losing precision), and it
+# writes NaN/Infinity as null. Input it rejects outright (NaN/Infinity
+# literals) and objects it cannot encode (ints beyond 64 bits) go through
+# stdlib json instead.
+def json_loads(data: bytes) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            pass
+    return json.loads(data)
+
+def json_dumps(obj: Any, indent: bool = False) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+        except TypeError:
+            pass
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+_OK_BODY = b'{"ok":true}'
 
-def require_root() -> bool:
-    # On macOS/Linux this exists; if not, assume no root.
-    return getattr(os, "geteuid", lambda: -1)() == 0
+def ok_response(**fields: Any) -> Response:
+    # Success bodies skip jsonify; a fresh Response each time since Flask
+    # mutates responses on the way out.
+    if not fields:
+        return Response(_OK_BODY, mimetype="application/json")
+    body = b'{"ok":true,' + json_dumps(fields)[1:]
+    return Response(body, mimetype="application/json")
+
+# Last known /etc/hosts contents keyed by (mtime_ns, size), stored as one
+# tuple so readers never pair a key with the wrong text.
+_hosts_cache: Tuple[Optional[Tuple[int, int]], str] = (None, "")
+
+def _hosts_key() -> Tuple[int, int]:
+    st = os.stat(HOSTS_FILE)
+    return st.st_mtime_ns, st.st_size
 
 def read_hosts() -> str:
+    global _hosts_cache
     try:
+        key = _hosts_key()
+        cached_key, cached_text = _hosts_cache
+        if key == cached_key:
+            return cached_text
         with open(HOSTS_FILE, "r", encoding="utf-8") as f:
-            return f.read()
+            text = f.read()
+        _hosts_cache = (key, text)
+        return text
     except Exception:
         return ""
 
-def write_hosts(text: str) -> bool:
+def _replace_hosts(payload: bytes) -> bool:
+    """Atomically swap `payload` into HOSTS_FILE; False if that isn't possible."""
+    # Replace the real file, not a symlink pointing at it (managed /etc layouts).
+    target = os.path.realpath(HOSTS_FILE)
     try:
-        with open(HOSTS_FILE, "w", encoding="utf-8") as f:
-            f.write(text)
-        return True
-    except PermissionError:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target),
+                                        prefix=".hosts.")
+    except OSError:
         return False
-    except Exception:
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        try:
+            mode = os.stat(target).st_mode & 0o7777
+        except OSError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, target)
+        return True
+    except OSError:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
         return False
 
+def write_hosts(text: str) -> bool:
+    global _hosts_cache
+    # Rename a per-call temp file over the original so resolvers never observe
+    # a half-written hosts file. If /etc isn't writable or the rename is
+    # refused (e.g. a bind-mounted /etc/hosts in a container), write in place.
+    payload = text.encode("utf-8")
+    if not _replace_hosts(payload):
+        try:
+            with open(HOSTS_FILE, "wb") as f:
+                f.write(payload)
+        except PermissionError:
+            return False
+        except Exception:
+            return False
+    try:
+        # We know the new contents; no need to read them back next time.
+        _hosts_cache = (_hosts_key(), text)
+    except OSError:
+        _hosts_cache = (None, "")
+    return True
+
 def strip_ultra_block_section(hosts_text: str) -> str:
-    pattern = re.compile(
-        re.escape(HOSTS_TAG_START) + r".*?" + re.escape(HOSTS_TAG_END),
-        re.DOTALL
-    )
-    cleaned = re.sub(pattern, "", hosts_text)
-    return cleaned.rstrip() + "\n"
+    # Plain substring scan; the tags are literals so no regex is needed.
+    start = hosts_text.find(HOSTS_TAG_START)
+    while start >= 0:
+        end = hosts_text.find(HOSTS_TAG_END, start)
+        if end < 0:
+            break
+        hosts_text = hosts_text[:start] + hosts_text[end + _HOSTS_TAG_END_LEN:]
+        start = hosts_text.find(HOSTS_TAG_START, start)
+    return hosts_text.rstrip() + "\n"
 
 def expand_domains(domains: List[str]) -> List[str]:
-    out: List[str] = []
+    # Insertion-ordered dict doubles as the dedup set: one pass, no scratch list.
+    uniq: Dict[str, None] = {}
     for d in domains:
         d = (d or "").strip().lower()
         if not d:
             continue
-        if d.startswith("http://") or d.startswith("https://"):
-            d = re.sub(r"^https?://", "", d)
-        d = d.split("/")[0]
-        out.append(d)
+        if d.startswith(("http://", "https://")):
+            d = d.split("://", 1)[1]
+        d = d.split("/", 1)[0]
+        uniq[d] = None
         if not d.startswith("www."):
-            out.append("www." + d)
-
-    seen = set()
-    uniq: List[str] = []
-    for d in out:
-        if d not in seen:
-            uniq.append(d)
-            seen.add(d)
-    return uniq
-
-def flush_dns() -> None:
-    if not is_macos():
-        return
-    cmds = [
-        ["dscacheutil", "-flushcache"],
-        ["killall", "-HUP", "mDNSResponder"]
-    ]
-    for c in cmds:
+            uniq.setdefault("www." + d, None)
+    return list(uniq)
+
+DNS_FLUSH_CMDS = [
+    ["dscacheutil", "-flushcache"],
+    ["killall", "-HUP", "mDNSResponder"]
+]
+
+# Flush commands run on one background worker so /api/block/* responses
+# don't wait on fork/exec + mDNSResponder restarts. A None entry after the
+# commands tells the worker to drop memoized lookups once the flush is done.
+_DNS_FLUSH_QUEUE: "queue.Queue[Optional[List[str]]]" = queue.Queue()
+_DNS_FLUSH_LOCK = threading.Lock()
+_dns_flush_started = False
+
+def _dns_flush_worker() -> None:
+    while True:
+        c = _DNS_FLUSH_QUEUE.get()
+        if c is None:
+            # Lookups made while the flush was pending may have hit the old
+            # mDNSResponder cache.
+            _resolve_cached.cache_clear()
+            continue
         try:
             subprocess.run(c, check=False,
                            stdout=subprocess.DEVNULL,
@@ -144,27 +298,40 @@ def flush_dns() -> None:
         except Exception:
             pass
 
+def flush_dns() -> None:
+    global _dns_flush_started
+    # Hosts/DNS changed: drop memoized /api/block/test answers too.
+    _resolve_cached.cache_clear()
+    if not IS_MACOS:
+        return
+    with _DNS_FLUSH_LOCK:
+        if not _dns_flush_started:
+            # Real thread or green thread, matching ASYNC_MODE.
+            socketio.start_background_task(_dns_flush_worker)
+            _dns_flush_started = True
+    for c in DNS_FLUSH_CMDS:
+        _DNS_FLUSH_QUEUE.put(c)
+    _DNS_FLUSH_QUEUE.put(None)
+
 def apply_hosts_block(domains: List[str]) -> Tuple[bool, Optional[str]]:
-    if not require_root():
+    # `domains` must already be normalized by expand_domains().
+    if not IS_ROOT:
         return False, "permission"
 
-    domains = expand_domains(domains)
     hosts = strip_ultra_block_section(read_hosts())
 
-    lines = [HOSTS_TAG_START]
-    for d in domains:
-        lines.append(f"127.0.0.1 {d}")
-        lines.append(f"::1 {d}")
-    lines.append(HOSTS_TAG_END)
+    parts = [hosts, "\n", HOSTS_TAG_START, "\n"]
+    parts.extend(f"127.0.0.1 {d}\n::1 {d}\n" for d in domains)
+    parts.append(HOSTS_TAG_END + "\n")
 
-    new_hosts = hosts + "\n" + "\n".join(lines) + "\n"
+    new_hosts = "".join(parts)
     if write_hosts(new_hosts):
         flush_dns()
         return True, None
     return False, "write_failed"
 
 def clear_hosts_block() -> Tuple[bool, Optional[str]]:
-    if not require_root():
+    if not IS_ROOT:
         return False, "permission"
     hosts = strip_ultra_block_section(read_hosts())
     if write_hosts(hosts):
@@ -173,62 +340,174 @@ def clear_hosts_block() -> Tuple[bool, Optional[str]]:
     return False, "write_failed"
 
 def resolve_all(domain: str) -> List[str]:
-    ips = set()
+    # SOCK_STREAM avoids duplicate TCP/UDP/RAW records; the dict dedups in
+    # resolver order (callers only check membership, so no sort).
+    ips: Dict[str, None] = {}
     try:
-        for fam, _, _, _, sockaddr in socket.getaddrinfo(domain, None):
-            ips.add(sockaddr[0])
+        for fam, _, _, _, sockaddr in socket.getaddrinfo(
+                domain, None, type=socket.SOCK_STREAM):
+            ips[sockaddr[0]] = None
     except Exception:
         pass
-    return sorted(ips)
+    return list(ips)
+
+@functools.lru_cache(maxsize=1024)
+def _resolve_cached(domain: str, bucket: int) -> Tuple[str, ...]:
+    return tuple(resolve_all(domain))
+
+def resolve_all_cached(domain: str) -> List[str]:
+    # The wall-clock bucket is part of the key, so entries expire every TTL.
+    return list(_resolve_cached(domain, int(time.time()) // RESOLVE_CACHE_TTL))
+
+# One long-lived `osascript -i` reads statements from stdin, so notifications
+# don't pay a fork/exec each. Respawned if it dies.
+_OSA: Optional[subprocess.Popen] = None
+_OSA_LOCK = threading.Lock()
+
+def _osa_quote(text: Any) -> str:
+    text = str(text).replace("\\", "\\\\").replace('"', '\\"')
+    return text.replace("\r", " ").replace("\n", " ")
+
+def _osascript() -> subprocess.Popen:
+    global _OSA
+    if _OSA is None or _OSA.poll() is not None:
+        _OSA = subprocess.Popen(["osascript", "-i"],
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL,
+                                text=True)
+    return _OSA
 
 def mac_notify(title: str, body: str) -> bool:
-    if not is_macos():
-        return False
-    try:
-        script = f'display notification "{body}" with title "{title}"'
-        subprocess.run(["osascript", "-e", script], check=False)
-        return True
-    except Exception:
+    global _OSA
+    if not IS_MACOS:
         return False
+    script = (f'display notification "{_osa_quote(body)}" '
+              f'with title "{_osa_quote(title)}"\n')
+    with _OSA_LOCK:
+        # Second attempt covers a coprocess that exited since the last call.
+        for _ in range(2):
+            try:
+                proc = _osascript()
+                proc.stdin.write(script)
+                proc.stdin.flush()
+                return True
+            except (OSError, ValueError):
+                _OSA = None
+            except Exception:
+                return False
+    return False
+
+# ---------------------------------------------------------------------------
+# Static payloads (serialized once at import; served as raw bytes)
+# ---------------------------------------------------------------------------
+STATIC_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+MANIFEST = {
+    "name": "Ultra Pomodoro",
+    "short_name": "Pomodoro",
+    "start_url": "/",
+    "display": "standalone",
+    "background_color": "#0b0b10",
+    "theme_color": "#0b0b10",
+    "icons": [
+        {
+            "src": "data:image/svg+xml;utf8,<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 100 100'><rect width='100' height='100' rx='22' fill='%230b0b10'/><text x='50' y='62' font-size='52' text-anchor='middle'>⏳</text></svg>",
+            "sizes": "192x192",
+            "type": "image/svg+xml"
+        }
+    ]
+}
+
+SW_JS = """
+self.addEventListener('install', e => self.skipWaiting());
+self.addEventListener('activate', e => self.clients.claim());
+self.addEventListener('fetch', e => {});
+"""
+
+_MANIFEST_BYTES = json.dumps(
+    MANIFEST, separators=(",", ":"), ensure_ascii=False
+).encode("utf-8")
+_SW_BYTES = SW_JS.encode("utf-8")
+
+def precompress(raw: bytes) -> Dict[str, bytes]:
+    """Content-Encoding -> body, keeping only variants smaller than `raw`."""
+    variants = {"gzip": gzip.compress(raw, 9)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(raw, quality=11)
+    return {enc: body for enc, body in variants.items() if len(body) < len(raw)}
+
+_MANIFEST_ENCODED = precompress(_MANIFEST_BYTES)
+_SW_ENCODED = precompress(_SW_BYTES)
+
+# index.html ships with the deploy: stat and read it once and serve it from
+# memory instead of touching the filesystem on every GET (restart the server
+# to pick up edits).
+try:
+    _INDEX_STAT: Optional[os.stat_result] = INDEX_PATH.stat()
+    _INDEX_BYTES = INDEX_PATH.read_bytes()
+except OSError:
+    _INDEX_STAT = None
+    _INDEX_BYTES = b""
+_INDEX_EXISTS = _INDEX_STAT is not None
+_INDEX_MTIME = int(_INDEX_STAT.st_mtime) if _INDEX_STAT else 0
+_INDEX_SIZE = len(_INDEX_BYTES)
+_INDEX_ETAG = f"{_INDEX_MTIME:x}-{_INDEX_SIZE:x}"
+_INDEX_ENCODED = precompress(_INDEX_BYTES) if _INDEX_EXISTS else {}
+
+def pick_encoding(variants: Dict[str, bytes]) -> Optional[str]:
+    # Prefer brotli, then gzip, honouring q=0 in Accept-Encoding.
+    accepted = request.accept_encodings
+    for enc in ("br", "gzip"):
+        if enc in variants and accepted[enc]:
+            return enc
+    return None
+
+def static_response(raw: bytes, variants: Dict[str, bytes],
+                    mimetype: str) -> Response:
+    enc = pick_encoding(variants)
+    resp = Response(variants[enc] if enc else raw, mimetype=mimetype,
+                    headers={"Cache-Control": STATIC_CACHE_CONTROL,
+                             "Vary": "Accept-Encoding"})
+    if enc:
+        resp.headers["Content-Encoding"] = enc
+    return resp
 
 # ---------------------------------------------------------------------------
 # Routes
 # ---------------------------------------------------------------------------
 @app.route("/")
 def index():
-    if INDEX_PATH.exists():
-        return send_from_directory(BASE_DIR, "index.html")
-    return "<h1>index.html not found</h1>", 404
+    if not _INDEX_EXISTS:
+        return "<h1>index.html not found</h1>", 404
+    if request.if_none_match.contains_weak(_INDEX_ETAG):
+        resp = Response(status=304)
+    elif USE_X_SENDFILE == "nginx":
+        resp = Response(mimetype="text/html")
+        resp.headers["X-Accel-Redirect"] = X_ACCEL_PREFIX + "index.html"
+    elif app.config["USE_X_SENDFILE"]:
+        # Flask answers with an X-Sendfile header and the proxy streams the file.
+        resp = send_from_directory(BASE_DIR, "index.html", etag=False)
+    else:
+        # Cached at import, so every encoding matches the weak ETag.
+        enc = pick_encoding(_INDEX_ENCODED)
+        resp = Response(_INDEX_ENCODED[enc] if enc else _INDEX_BYTES,
+                        mimetype="text/html")
+        if enc:
+            resp.headers["Content-Encoding"] = enc
+        resp.cache_control.no_cache = True
+        resp.last_modified = _INDEX_MTIME
+    resp.set_etag(_INDEX_ETAG, weak=True)
+    resp.vary.add("Accept-Encoding")
+    return resp
 
 @app.route("/manifest.json")
 def manifest():
-    data = {
-        "name": "Ultra Pomodoro",
-        "short_name": "Pomodoro",
-        "start_url": "/",
-        "display": "standalone",
-        "background_color": "#0b0b10",
-        "theme_color": "#0b0b10",
-        "icons": [
-            {
-                "src": "data:image/svg+xml;utf8,<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 100 100'><rect width='100' height='100' rx='22' fill='%230b0b10'/><text x='50' y='62' font-size='52' text-anchor='middle'>⏳</text></svg>",
-                "sizes": "192x192",
-                "type": "image/svg+xml"
-            }
-        ]
-    }
-    return jsonify(data)
+    return static_response(_MANIFEST_BYTES, _MANIFEST_ENCODED, "application/json")
 
 @app.route("/sw.js")
 def sw():
-    js = """
-self.addEventListener('install', e => self.skipWaiting());
-self.addEventListener('activate', e => self.clients.claim());
-self.addEventListener('fetch', e => {});
-"""
-    resp = make_response(js)
-    resp.headers["Content-Type"] = "application/javascript"
-    return resp
+    return static_response(_SW_BYTES, _SW_ENCODED, "application/javascript")
 
 @app.route("/api/notify", methods=["POST"])
 def api_notify():
@@ -238,123 +517,208 @@ def api_notify():
     ok = mac_notify(title, body)
     return jsonify({"ok": ok})
 
+_EXPORT_PREFIX = b'{"ok":true,"data":'
+_EXPORT_SUFFIX = b"}"
+EXPORT_CHUNK = 64 * 1024
+
+def _stream_export(f: BinaryIO) -> Iterator[bytes]:
+    # `f` is closed by the response (call_on_close), even if never iterated.
+    yield _EXPORT_PREFIX
+    for chunk in iter(lambda: f.read(EXPORT_CHUNK), b""):
+        yield chunk
+    yield _EXPORT_SUFFIX
+
 @app.route("/api/export")
 def api_export():
+    # The file is only ever written by /api/import as valid JSON, so splice its
+    # bytes straight into the envelope instead of parsing and re-serializing.
     try:
-        if EXPORT_PATH.exists():
-            with open(EXPORT_PATH, "r", encoding="utf-8") as f:
-                return jsonify({"ok": True, "data": json.load(f)})
-    except Exception:
-        pass
-    return jsonify({"ok": True, "data": None})
+        f = open(EXPORT_PATH, "rb")
+    except OSError:
+        return ok_response(data=None)
+    size = os.fstat(f.fileno()).st_size
+    if not size:
+        f.close()
+        return ok_response(data=None)
+    resp = Response(_stream_export(f), mimetype="application/json")
+    resp.call_on_close(f.close)
+    resp.content_length = len(_EXPORT_PREFIX) + size + len(_EXPORT_SUFFIX)
+    return resp
 
 @app.route("/api/import", methods=["POST"])
 def api_import():
-    data = request.get_json(force=True) or {}
     try:
-        with open(EXPORT_PATH, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        return jsonify({"ok": True})
+        data = json_loads(request.get_data(cache=False)) or {}
+    except ValueError:
+        return jsonify({"ok": False, "error": "invalid json"}), 400
+    tmp_path = None
+    try:
+        # Swap in a new file so an export streaming the old one stays
+        # consistent; a per-call temp name keeps concurrent imports apart.
+        fd, tmp_path = tempfile.mkstemp(dir=BASE_DIR, prefix=EXPORT_PATH.name)
+        with os.fdopen(fd, "wb") as f:
+            f.write(json_dumps(data, indent=True))
+        try:
+            mode = os.stat(EXPORT_PATH).st_mode & 0o7777
+        except OSError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, EXPORT_PATH)
+        return ok_response()
     except Exception as e:
+        if tmp_path is not None:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.route("/api/block/apply", methods=["POST"])
 def api_block_apply():
     data = request.get_json(force=True) or {}
-    domains = data.get("domains", []) or []
+    domains = expand_domains(data.get("domains", []) or [])
     ok, err = apply_hosts_block(domains)
     if not ok:
         return jsonify({"ok": False, "error": err}), 403 if err == "permission" else 500
-    return jsonify({"ok": True, "domains": expand_domains(domains)})
+    return ok_response(domains=domains)
 
 @app.route("/api/block/clear", methods=["POST"])
 def api_block_clear():
     ok, err = clear_hosts_block()
     if not ok:
         return jsonify({"ok": False, "error": err}), 403 if err == "permission" else 500
-    return jsonify({"ok": True})
+    return ok_response()
 
 @app.route("/api/block/flush", methods=["POST"])
 def api_block_flush():
     flush_dns()
-    return jsonify({"ok": True})
+    return ok_response()
 
 @app.route("/api/block/test", methods=["POST"])
 def api_block_test():
     data = request.get_json(force=True) or {}
     domains = expand_domains(data.get("domains", []) or [])
-    resolutions = {d: resolve_all(d) for d in domains}
-    return jsonify({"ok": True, "resolutions": resolutions})
+    resolutions = dict(zip(domains, _RESOLVER_POOL.map(resolve_all_cached, domains)))
+    return ok_response(resolutions=resolutions)
 
 # ---------------------------------------------------------------------------
 # Socket Rooms
 # ---------------------------------------------------------------------------
-def members_in(room_id: str) -> int:
-    rooms = socketio.server.manager.rooms.get("/", {})
-    return len(rooms.get(room_id, set()))
+# Member counts are kept incrementally (O(1) per emit) instead of asking the
+# Socket.IO manager; _SID_ROOMS remembers each client's rooms for disconnect.
+_ROOM_COUNTS: Dict[str, int] = {}
+_SID_ROOMS: Dict[str, Set[str]] = {}
+_ROOMS_LOCK = threading.Lock()
+
+def _track_join(sid: str, room_id: str) -> int:
+    with _ROOMS_LOCK:
+        rooms = _SID_ROOMS.setdefault(sid, set())
+        if room_id not in rooms:
+            rooms.add(room_id)
+            _ROOM_COUNTS[room_id] = _ROOM_COUNTS.get(room_id, 0) + 1
+        return _ROOM_COUNTS[room_id]
+
+def _untrack_room(room_id: str) -> int:
+    count = _ROOM_COUNTS.get(room_id, 0) - 1
+    if count > 0:
+        _ROOM_COUNTS[room_id] = count
+    else:
+        _ROOM_COUNTS.pop(room_id, None)
+    return max(count, 0)
+
+def _track_leave(sid: str, room_id: str) -> int:
+    with _ROOMS_LOCK:
+        rooms = _SID_ROOMS.get(sid)
+        if rooms is None or room_id not in rooms:
+            return _ROOM_COUNTS.get(room_id, 0)
+        rooms.discard(room_id)
+        if not rooms:
+            del _SID_ROOMS[sid]
+        return _untrack_room(room_id)
+
+def has_peers(sid: str, room_id: str) -> bool:
+    # Anyone besides `sid` to relay to? Lets solo rooms skip packet encoding.
+    members = _ROOM_COUNTS.get(room_id, 0)
+    if room_id in _SID_ROOMS.get(sid, ()):
+        members -= 1
+    return members > 0
+
+def _rid(data: Any) -> str:
+    # Socket payloads are dicts on the hot path; anything else has no roomId.
+    return data.get("roomId", "").strip() if type(data) is dict else ""
 
 def new_room_id() -> str:
     return "room-" + secrets.token_hex(3)
 
+@socketio.on("disconnect")
+def on_disconnect():
+    with _ROOMS_LOCK:
+        for room_id in _SID_ROOMS.pop(request.sid, ()):
+            _untrack_room(room_id)
+
 @socketio.on("room:join")
 def on_room_join(data):
-    room_id = (data or {}).get("roomId", "").strip()
+    room_id = _rid(data)
     if not room_id:
         return {"ok": False, "error": "missing roomId"}
     join_room(room_id)
+    members = _track_join(request.sid, room_id)
     emit("room:joined",
-         {"roomId": room_id, "members": members_in(room_id)},
+         {"roomId": room_id, "members": members},
          room=request.sid)
     emit("room:members",
-         {"roomId": room_id, "members": members_in(room_id)},
+         {"roomId": room_id, "members": members},
          room=room_id)
-    return {"ok": True, "roomId": room_id, "members": members_in(room_id)}
+    return {"ok": True, "roomId": room_id, "members": members}
 
 @socketio.on("room:create")
 def on_room_create(data):
-    room_id = (data or {}).get("roomId", "").strip() or new_room_id()
+    room_id = _rid(data) or new_room_id()
     join_room(room_id)
+    members = _track_join(request.sid, room_id)
     emit("room:created",
-         {"roomId": room_id, "members": members_in(room_id)},
+         {"roomId": room_id, "members": members},
          room=request.sid)
     emit("room:members",
-         {"roomId": room_id, "members": members_in(room_id)},
+         {"roomId": room_id, "members": members},
          room=room_id)
-    return {"ok": True, "roomId": room_id, "members": members_in(room_id)}
+    return {"ok": True, "roomId": room_id, "members": members}
 
 @socketio.on("room:leave")
 def on_room_leave(data):
-    room_id = (data or {}).get("roomId", "").strip()
+    room_id = _rid(data)
     if not room_id:
         return {"ok": False, "error": "missing roomId"}
     leave_room(room_id)
+    members = _track_leave(request.sid, room_id)
     emit("room:members",
-         {"roomId": room_id, "members": members_in(room_id)},
+         {"roomId": room_id, "members": members},
          room=room_id)
     emit("room:left",
-         {"roomId": room_id, "members": members_in(room_id)},
+         {"roomId": room_id, "members": members},
          room=request.sid)
-    return {"ok": True, "roomId": room_id, "members": members_in(room_id)}
+    return {"ok": True, "roomId": room_id, "members": members}
 
 @socketio.on("timer:sync")
 def on_timer_sync(data):
-    room_id = (data or {}).get("roomId", "").strip()
-    if not room_id:
+    room_id = _rid(data)
+    if not room_id or not has_peers(request.sid, room_id):
         return
+    # python-socketio encodes a broadcast once and reuses it for every member.
     emit("timer:state", data, room=room_id, include_self=False)
 
 @socketio.on("timer:request")
 def on_timer_request(data):
-    room_id = (data or {}).get("roomId", "").strip()
-    if not room_id:
+    room_id = _rid(data)
+    if not room_id or not has_peers(request.sid, room_id):
         return
     # Ask other members to broadcast their timer state to the requester
     emit("timer:request", data, room=room_id, include_self=False)
 
 @socketio.on("timer:penalty")
 def on_timer_penalty(data):
-    room_id = (data or {}).get("roomId", "").strip()
-    if not room_id:
+    room_id = _rid(data)
+    if not room_id or not has_peers(request.sid, room_id):
         return
     emit("timer:penalty", data, room=room_id, include_self=False)
 
@@ -364,7 +728,7 @@ def on_timer_penalty(data):
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", "8000"))
     print(f"Ultra Pomodoro running on http://localhost:{port}")
-    if require_root():
+    if IS_ROOT:
         print("[BLOCK] Hosts blocking ENABLED (running as root).")
     else:
         print("[BLOCK] Hosts blocking DISABLED (run with sudo to enable).")